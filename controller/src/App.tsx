@@ -9,6 +9,7 @@ import {
   useRef,
   useState,
   type Dispatch,
+  type MutableRefObject,
   type SetStateAction,
 } from "react";
 import { useInterval } from "react-use";
@@ -18,6 +19,7 @@ export type Setter<T> = Dispatch<SetStateAction<T>>;
 
 const HOST = "thomas@bracketbot.local";
 const TOPIC = "robot/drive";
+const PREVIEW_TOPIC = "robot/camera/preview";
 
 function useMqtt() {
   const client = useRef<mqtt.MqttClient | null>(null);
@@ -51,6 +53,38 @@ function useMqtt() {
   return { client, connected, reconnect };
 }
 
+function usePreview(
+  client: MutableRefObject<mqtt.MqttClient | null>,
+  connected: boolean,
+) {
+  const [src, setSrc] = useState<string | null>(null);
+  useEffect(() => {
+    const current = client.current;
+    if (!connected || !current) return;
+
+    let url: string | null = null;
+    const onMessage = (topic: string, payload: Uint8Array) => {
+      if (topic !== PREVIEW_TOPIC) return;
+      const next = URL.createObjectURL(
+        new Blob([payload], { type: "image/jpeg" }),
+      );
+      if (url) URL.revokeObjectURL(url);
+      url = next;
+      setSrc(next);
+    };
+
+    current.subscribe(PREVIEW_TOPIC);
+    current.on("message", onMessage);
+    return () => {
+      current.off("message", onMessage);
+      current.unsubscribe(PREVIEW_TOPIC);
+      if (url) URL.revokeObjectURL(url);
+    };
+  }, [client, connected]);
+
+  return src;
+}
+
 const ACCEL = 10;
 const DECEL = 10;
 const INTERVAL = 100;
@@ -58,6 +92,7 @@ const INTERVAL_MULTIPLIER = INTERVAL / 1000;
 
 function App() {
   const { client, connected, reconnect } = useMqtt();
+  const preview = usePreview(client, connected);
   const [invert, setInvert] = useState(false);
 
   const [targetLinearVelocity, setTargetLinearVelocity] = useState(0);
@@ -138,6 +173,9 @@ function App() {
   return (
     <div className="flex h-svh w-svw flex-col items-center justify-between px-10 py-2">
       <Toaster />
+      {preview && (
+        <img src={preview} alt="Camera preview" className="max-h-48 rounded" />
+      )}
       <div className="flex flex-col items-stretch gap-2">
         <Badge
           variant={connected ? "default" : "destructive"}
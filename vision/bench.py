@@ -0,0 +1,362 @@
+# End-to-end profiler for the vision loop.
+#
+# Runs capture -> rotate/encode -> upload -> inference -> action from
+# vision/main.py against recorded frames, a local S3 stand-in and a fake
+# chat-completions server, and records wall time, CPU time and RSS for
+# every stage of every iteration. Writes <out>.json and <out>.folded; the
+# folded stacks come from a sampling profiler and load straight into
+# flamegraph.pl or speedscope.
+#
+# The stand-ins run in a subprocess and the sampler's own CPU is subtracted,
+# so cpu_ms is the loop plus the threads it starts (e.g. s3transfer).
+#
+#   python -m vision.bench frames/ --iterations 20 --latency 0.8 --out bench
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import psutil
+
+STAGES = ["capture", "rotate_encode", "upload", "inference", "action"]
+SAMPLE_INTERVAL = 0.005
+
+FAKE_RESPONSE = """The path ahead is clear, keep going straight.
+```json
+{{"linear_velocity": 0.3, "angular_velocity": 0.0, "duration": {duration}}}
+```"""
+
+
+class ReplayCamera:
+    """Serves recorded frames from a directory in a loop, like USBCamera."""
+
+    def __init__(self, directory):
+        paths = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.lower().endswith((".png", ".jpg", ".jpeg"))
+        )
+        if not paths:
+            raise Exception(f"No frames found in {directory}")
+        self.frames = [cv2.imread(path) for path in paths]
+        self.index = 0
+
+    def get_frame(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+    def release(self):
+        pass
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def s3_handler():
+    objects = {}
+
+    class S3Handler(BaseHTTPRequestHandler):
+        # Just enough of PutObject/GetObject for boto3's upload_file.
+        # HTTP/1.1 so Expect: 100-continue is answered instead of timing out
+        protocol_version = "HTTP/1.1"
+
+        def do_PUT(self):
+            length = int(self.headers.get("Content-Length", 0))
+            objects[self.path.split("?")[0]] = self.rfile.read(length)
+            self.send_response(200)
+            self.send_header("ETag", '"bench"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            body = objects.get(self.path.split("?")[0])
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return S3Handler
+
+
+def chat_handler(latency, duration):
+    content = FAKE_RESPONSE.format(duration=duration)
+
+    class ChatHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            time.sleep(latency)
+
+            body = json.dumps(
+                {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "bench"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChatHandler
+
+
+class StackSampler:
+    """
+    Samples every thread's stack, prefixed with the current stage and the
+    thread name, so work boto3 hands to s3transfer workers shows up too.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stage = "idle"
+        self.stacks = Counter()
+        self.cpu = 0.0  # CPU spent sampling, subtracted from stage timings
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, name="sampler", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        me = threading.get_ident()
+        while self.running:
+            cpu = time.thread_time()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({name})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stack.append(self.stage)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.cpu += time.thread_time() - cpu
+            time.sleep(self.interval)
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def cpu_time(sampler):
+    # Process CPU minus the profiler's own share
+    return time.process_time() - sampler.cpu
+
+
+class StageTimer:
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.process = psutil.Process()
+        self.results = {}
+
+    def run(self, stage, fn, *args):
+        self.sampler.stage = stage
+        rss = self.process.memory_info().rss
+        # Process-wide, boto3 uploads on worker threads
+        cpu = cpu_time(self.sampler)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.results[stage] = {
+                "wall_ms": (time.perf_counter() - start) * 1000,
+                "cpu_ms": (cpu_time(self.sampler) - cpu) * 1000,
+                "rss_delta_kb": (self.process.memory_info().rss - rss) / 1024,
+            }
+            self.sampler.stage = "idle"
+
+
+def summarize(iterations):
+    summary = {}
+    if not iterations:
+        return summary
+    for stage in STAGES + ["total"]:
+        wall = [it["stages"][stage]["wall_ms"] for it in iterations]
+        cpu = [it["stages"][stage]["cpu_ms"] for it in iterations]
+        wall_sorted = sorted(wall)
+        summary[stage] = {
+            "wall_ms_mean": round(statistics.mean(wall), 3),
+            "wall_ms_p50": round(statistics.median(wall), 3),
+            "wall_ms_p95": round(wall_sorted[int(0.95 * (len(wall) - 1))], 3),
+            "wall_ms_max": round(wall_sorted[-1], 3),
+            "cpu_ms_mean": round(statistics.mean(cpu), 3),
+        }
+    return summary
+
+
+def serve_standins(latency, duration, conn):
+    # Runs in a subprocess so the servers don't show up in the loop's CPU time
+    s3_server, s3_url = start_server(s3_handler())
+    chat_server, chat_url = start_server(chat_handler(latency, duration))
+    conn.send((s3_url, chat_url))
+    conn.recv()  # Blocks until the parent is done
+    s3_server.shutdown()
+    chat_server.shutdown()
+
+
+def run(args):
+    conn, child_conn = multiprocessing.Pipe()
+    standins = multiprocessing.Process(
+        target=serve_standins,
+        args=(args.latency, args.duration, child_conn),
+        daemon=True,
+    )
+    standins.start()
+    s3_url, chat_url = conn.recv()
+
+    # Point vision.main and vision.s3 at the stand-ins before they're imported
+    os.environ.update(
+        {
+            "AWS_ENDPOINT_URL": s3_url,
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_BUCKET_NAME": "bench",
+            "AWS_REQUEST_CHECKSUM_CALCULATION": "when_required",
+            "GROQ_API_KEY": "bench",
+            "GROQ_BASE_URL": chat_url,
+        }
+    )
+    from groq import Groq
+
+    from vision import main
+
+    main.client = Groq(api_key="bench", base_url=chat_url)
+    camera = ReplayCamera(args.frames)
+    photo = os.path.join(args.workdir, "photo.png")
+
+    def act(action):
+        main.set_velocity(action["linear_velocity"], action["angular_velocity"])
+        time.sleep(action["duration"] / 100)
+        main.set_velocity(0, 0)
+
+    sampler = StackSampler(args.sample_interval / 1000)
+    if args.sample_interval > 0:
+        sampler.start()
+    process = psutil.Process()
+    iterations = []
+    try:
+        for i in range(args.iterations):
+            timer = StageTimer(sampler)
+            start = time.perf_counter()
+            cpu = cpu_time(sampler)
+
+            frame = timer.run("capture", main.capture_frame, camera)
+            timer.run("rotate_encode", main.save_photo, frame, photo)
+            url = timer.run("upload", main.upload_photo, photo)
+            if url is None:
+                # upload_to_s3 logs and swallows errors, don't report a broken run
+                raise RuntimeError("Upload to the S3 stand-in failed")
+            text = timer.run("inference", main.ask, url)
+            action = main.parse_actions(text)[0]
+            timer.run("action", act, action)
+
+            timer.results["total"] = {
+                "wall_ms": (time.perf_counter() - start) * 1000,
+                "cpu_ms": (cpu_time(sampler) - cpu) * 1000,
+            }
+            iterations.append(
+                {
+                    "iteration": i,
+                    "rss_mb": round(process.memory_info().rss / 2**20, 2),
+                    "stages": timer.results,
+                }
+            )
+    finally:
+        sampler.stop()
+        conn.send("stop")
+        standins.join(timeout=5)
+
+    report = {
+        "config": {
+            "frames": args.frames,
+            "iterations": args.iterations,
+            "latency_s": args.latency,
+            "action_cs": args.duration,
+            "sample_interval_ms": args.sample_interval,
+        },
+        "summary": summarize(iterations),
+        "iterations": iterations,
+    }
+    return report, sampler.folded()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the vision loop")
+    parser.add_argument("frames", help="directory of recorded frames")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="fake model latency (s)"
+    )
+    parser.add_argument(
+        "--duration", type=int, default=10, help="action duration (centiseconds)"
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=SAMPLE_INTERVAL * 1000,
+        help="stack sampling interval (ms), 0 disables the flame graph",
+    )
+    parser.add_argument("--workdir", default=".", help="where photo.png is written")
+    parser.add_argument("--out", default="bench", help="output prefix")
+    args = parser.parse_args()
+
+    report, folded = run(args)
+    with open(f"{args.out}.json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(f"{args.out}.folded", "w") as f:
+        f.write(folded)
+
+    for stage, stats in report["summary"].items():
+        print(f"{stage:>14}: {json.dumps(stats)}")
+
+
+if __name__ == "__main__":
+    main()
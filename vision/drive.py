@@ -6,117 +6,103 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-import json
 import os
+import signal
 import sys
 import time
 
+import drive_common
 import paho.mqtt.client as mqtt
-from odrive_uart import ODriveUART
+from drive_common import parse_command, wheel_speeds
+from drive_log import Recorder
+from log import get_logger
+from telemetry import TelemetryPublisher, TelemetrySampler
 
 # Constants
 MQTT_BROKER_ADDRESS = "localhost"
 MQTT_TOPIC = "robot/drive"
-LINEAR_SPEED = 0.2
-ANGULAR_SPEED = 1.2
-WHEEL_BASE = 0.4
 
+log = get_logger("drive", sample={"set_speeds": 10})
 
-# Load motor directions from JSON
-def load_motor_dirs():
-    try:
-        with open(os.path.expanduser("~/quickstart/lib/motor_dir.json"), "r") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error reading motor_dir.json: {e}")
-        raise
-
-
-motor_dirs = load_motor_dirs()
-
-# Initialize motor controller
-motor_controller = ODriveUART(
-    port="/dev/ttyAMA1",
-    left_axis=0,
-    right_axis=1,
-    dir_left=motor_dirs["left"],
-    dir_right=motor_dirs["right"],
-)
+motor_controller = None
+recorder = None
 
-# Start motors and set mode
-motor_controller.start_left()
-motor_controller.start_right()
-motor_controller.enable_velocity_mode_left()
-motor_controller.enable_velocity_mode_right()
-motor_controller.disable_watchdog_left()
-motor_controller.disable_watchdog_right()
 
-# Clear motor errors
-motor_controller.clear_errors_left()
-motor_controller.clear_errors_right()
+def init_motor_controller(bus=None, motor_dirs=None):
+    global motor_controller
+    motor_controller = drive_common.init_motor_controller(
+        motor_dirs=motor_dirs, bus=bus, recorder=recorder
+    )
 
 
 # Set velocities for the motors
 def set_velocity(linear, angular):
-    left = linear - (WHEEL_BASE / 2) * angular
-    right = linear + (WHEEL_BASE / 2) * angular
+    left, right = wheel_speeds(linear, angular)
     motor_controller.set_speed_mps_left(left)
     motor_controller.set_speed_mps_right(right)
-    print(f"Set speeds: Left={left} m/s, Right={right} m/s")
+    log.info("set_speeds", left=left, right=right)
 
 
 # MQTT Callbacks
 def on_connect(client, userdata, flags, rc):
-    print(f"Connected with result code {rc}")
+    log.info("connected", rc=rc)
     client.subscribe(MQTT_TOPIC)
 
 
 def on_command(payload):
-    try:
-        # Handle JSON command
-        data = json.loads(payload)
-        if "linear_velocity" in data and "angular_velocity" in data:
-            set_velocity(data["linear_velocity"], data["angular_velocity"])
-    except json.JSONDecodeError:
-        # Handle simple text commands
-        command_map = {
-            "forward": (LINEAR_SPEED, 0),
-            "back": (-LINEAR_SPEED, 0),
-            "left": (0, ANGULAR_SPEED),
-            "right": (0, -ANGULAR_SPEED),
-            "stop": (0, 0),
-        }
-        if payload in command_map:
-            set_velocity(*command_map[payload])
+    command = parse_command(payload)
+    if command is not None:
+        set_velocity(*command)
 
 
 def on_message(client, userdata, msg):
     payload = msg.payload.decode().strip().lower()
-    print(f"Received: {payload}")
+    log.debug("received", payload=payload)
+    if recorder is not None:
+        recorder.command(payload)
 
     on_command(payload)
 
 
+def on_sigterm(signum, frame):
+    # Unwind through main()'s finally so motors stop and the log is closed
+    raise KeyboardInterrupt
+
+
 # Main loop
 def main():
+    global recorder
+    signal.signal(signal.SIGTERM, on_sigterm)
+    # Set DRIVE_LOG to record commands and UART traffic for drive_log.py
+    if os.getenv("DRIVE_LOG"):
+        recorder = Recorder(os.getenv("DRIVE_LOG"))
+    init_motor_controller()
+
     client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
 
+    publisher = TelemetryPublisher(client)
+    sampler = TelemetrySampler(motor_controller, publisher)
+
     try:
         client.connect(MQTT_BROKER_ADDRESS)
         client.loop_start()
-        print("Listening for commands... Press Ctrl+C to exit.")
+        publisher.start()
+        sampler.start()
+        log.info("listening")
 
         while True:
             time.sleep(1)
 
     except KeyboardInterrupt:
-        print("Exiting...")
+        log.info("exiting")
     except Exception as e:
-        print(f"Error: {e}")
+        log.error("error", error=e)
 
     finally:
+        sampler.stop()
+        publisher.stop()
         # Stop motors and clean up
         motor_controller.set_speed_mps_left(0)
         motor_controller.set_speed_mps_right(0)
@@ -124,7 +110,9 @@ def main():
         client.disconnect()
         motor_controller.clear_errors_left()
         motor_controller.clear_errors_right()
-        print("Shutdown complete.")
+        if recorder is not None:
+            recorder.close()
+        log.info("shutdown_complete")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+# Command parsing, kinematics and ODrive setup shared by drive.py and drive_mux.py
+
+import json
+import os
+
+from log import get_logger
+from odrive_uart import ODriveUART
+
+LINEAR_SPEED = 0.2
+ANGULAR_SPEED = 1.2
+WHEEL_BASE = 0.4
+MOTOR_DIR_PATH = "~/quickstart/lib/motor_dir.json"
+
+COMMAND_MAP = {
+    "forward": (LINEAR_SPEED, 0),
+    "back": (-LINEAR_SPEED, 0),
+    "left": (0, ANGULAR_SPEED),
+    "right": (0, -ANGULAR_SPEED),
+    "stop": (0, 0),
+}
+
+log = get_logger("drive_common")
+
+
+# Returns (linear, angular) or None if the payload isn't a drive command
+def parse_command(payload):
+    try:
+        # Handle JSON command
+        data = json.loads(payload)
+        if (
+            isinstance(data, dict)
+            and "linear_velocity" in data
+            and "angular_velocity" in data
+        ):
+            return data["linear_velocity"], data["angular_velocity"]
+    except json.JSONDecodeError:
+        # Handle simple text commands
+        return COMMAND_MAP.get(payload)
+    return None
+
+
+def wheel_speeds(linear, angular):
+    left = linear - (WHEEL_BASE / 2) * angular
+    right = linear + (WHEEL_BASE / 2) * angular
+    return left, right
+
+
+# Load motor directions from JSON
+def load_motor_dirs(path=MOTOR_DIR_PATH):
+    try:
+        with open(os.path.expanduser(path), "r") as f:
+            return json.load(f)
+    except Exception as e:
+        log.error("motor_dir_error", path=path, error=e)
+        raise
+
+
+def init_motor_controller(
+    port="/dev/ttyAMA1",
+    left_axis=0,
+    right_axis=1,
+    motor_dirs=None,
+    bus=None,
+    recorder=None,
+):
+    if motor_dirs is None:
+        motor_dirs = load_motor_dirs()
+
+    # Initialize motor controller
+    motor_controller = ODriveUART(
+        port=port,
+        left_axis=left_axis,
+        right_axis=right_axis,
+        dir_left=motor_dirs["left"],
+        dir_right=motor_dirs["right"],
+        bus=bus,
+        recorder=recorder,
+    )
+
+    # Start motors and set mode
+    motor_controller.start_left()
+    motor_controller.start_right()
+    motor_controller.enable_velocity_mode_left()
+    motor_controller.enable_velocity_mode_right()
+    motor_controller.disable_watchdog_left()
+    motor_controller.disable_watchdog_right()
+
+    # Clear motor errors
+    motor_controller.clear_errors_left()
+    motor_controller.clear_errors_right()
+    return motor_controller
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# Binary record/replay log for the drive process.
+#
+# The file is an 8 byte magic followed by fixed header records:
+#   int64 monotonic ns | uint8 kind | uint16 payload length | payload
+# so it can be mmapped and walked without parsing anything but headers.
+# Each run starts with a SESSION record; monotonic clocks are per boot, so
+# replay restarts its timing at every one.
+#
+# Record:  DRIVE_LOG=drive.log python drive.py
+# Replay:  python drive_log.py drive.log [speed]   (speed 0 = as fast as possible)
+
+import mmap
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"DRVLOG1\0"
+HEADER = struct.Struct("<qBH")
+TELEMETRY = struct.Struct("<Bff")  # axis, position (turns), velocity (rpm)
+SESSION = struct.Struct("<d")  # wall clock time the recorder opened
+FLUSH_EVERY = 64  # records
+FLUSH_INTERVAL = 0.5  # seconds, for quiet periods
+
+MQTT_COMMAND = 1
+UART_TX = 2
+UART_RX = 3
+TELEMETRY_SAMPLE = 4
+SESSION_START = 5
+
+KIND_NAMES = {
+    MQTT_COMMAND: "mqtt",
+    UART_TX: "uart_tx",
+    UART_RX: "uart_rx",
+    TELEMETRY_SAMPLE: "telemetry",
+    SESSION_START: "session",
+}
+
+
+class Recorder:
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.unflushed = 0
+        self.closed = False
+        self.record(SESSION_START, SESSION.pack(time.time()))
+
+        # Flush regularly so a crash or power loss keeps the last records
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        payload = payload[:0xFFFF]
+        header = HEADER.pack(time.monotonic_ns(), kind, len(payload))
+        with self.lock:
+            if self.closed:
+                return
+            self.file.write(header)
+            self.file.write(payload)
+            self.unflushed += 1
+            if self.unflushed >= FLUSH_EVERY:
+                self.flush_locked()
+
+    def flush_locked(self):
+        self.file.flush()
+        self.unflushed = 0
+
+    def run(self):
+        while not self.closed:
+            time.sleep(FLUSH_INTERVAL)
+            with self.lock:
+                if not self.closed and self.unflushed:
+                    self.flush_locked()
+
+    def command(self, payload):
+        self.record(MQTT_COMMAND, payload)
+
+    def uart_tx(self, command):
+        self.record(UART_TX, command)
+
+    def uart_rx(self, response):
+        self.record(UART_RX, response)
+
+    def telemetry(self, axis, pos, vel):
+        self.record(TELEMETRY_SAMPLE, TELEMETRY.pack(axis, pos, vel))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.file.close()
+
+
+def read_log(path):
+    """Yields (monotonic_ns, kind, payload) for every record in the log."""
+    with open(path, "rb") as f:
+        if f.seek(0, 2) <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a drive log")
+            offset = len(MAGIC)
+            while offset + HEADER.size <= len(mm):
+                t_ns, kind, length = HEADER.unpack_from(mm, offset)
+                offset += HEADER.size
+                if offset + length > len(mm):
+                    break  # Truncated tail from an unclean shutdown
+                yield t_ns, kind, mm[offset : offset + length]
+                offset += length
+
+
+class SimulatedPort:
+    """
+    Stand-in for serial.Serial that answers reads with the recorded UART
+    responses in order. byte_time adds the wire time of each byte written.
+    """
+
+    def __init__(self, responses, byte_time=0.0):
+        self.responses = iter(responses)
+        self.byte_time = byte_time
+        self.bytes_written = 0
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.byte_time:
+            time.sleep(len(data) * self.byte_time)
+        return len(data)
+
+    def readline(self):
+        return next(self.responses, b"") + b"\n"
+
+
+def recorded_responses(path):
+    return [payload for _, kind, payload in read_log(path) if kind == UART_RX]
+
+
+def replay(path, on_command, speed=1.0):
+    """
+    Feeds recorded MQTT commands to on_command with the original spacing
+    divided by speed. Returns per-command handling time for profiling.
+    """
+    count = 0
+    total = 0.0
+    worst = 0.0
+    first = None
+    start = time.monotonic()
+    session_start = start
+    for t_ns, kind, payload in read_log(path):
+        if kind == SESSION_START:
+            # New run, possibly a new boot, so restart the timing base
+            first = None
+            continue
+        if kind != MQTT_COMMAND:
+            continue
+        if first is None:
+            session_start = time.monotonic()
+            first = t_ns
+        if speed:
+            elapsed = time.monotonic() - session_start
+            delay = (t_ns - first) / 1e9 / speed - elapsed
+            if delay > 0:
+                time.sleep(delay)
+
+        t = time.perf_counter()
+        on_command(payload.decode())
+        elapsed = time.perf_counter() - t
+
+        count += 1
+        total += elapsed
+        worst = max(worst, elapsed)
+
+    return {
+        "commands": count,
+        "wall_s": round(time.monotonic() - start, 3),
+        "handle_avg_ms": round(total / count * 1000, 3) if count else 0.0,
+        "handle_max_ms": round(worst * 1000, 3),
+    }
+
+
+def main():
+    import drive
+
+    path = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    # 10 bits per byte at 115200 baud
+    port = SimulatedPort(recorded_responses(path), byte_time=10 / 115200)
+    # Directions only flip signs on the wire, so replay doesn't need the robot's file
+    drive.init_motor_controller(bus=port, motor_dirs={"left": 1, "right": 1})
+    print(replay(path, drive.on_command, speed))
+
+
+if __name__ == "__main__":
+    main()
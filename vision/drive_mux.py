@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+# Drives several ODrive boards from one process and one MQTT connection.
+# Each serial link gets its own worker thread so a slow board can't stall
+# the others. Robots are loaded from a JSON config:
+#
+# {
+#     "broker": "localhost",
+#     "subscribe": ["robot/+/drive"],
+#     "robots": [
+#         {
+#             "name": "left-rig",
+#             "port": "/dev/ttyAMA1",
+#             "left_axis": 0,
+#             "right_axis": 1,
+#             "motor_dir": "~/quickstart/lib/motor_dir.json",
+#             "topic": "robot/left-rig/drive"
+#         }
+#     ]
+# }
+
+import json
+import os
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from drive_common import (
+    MOTOR_DIR_PATH,
+    init_motor_controller,
+    load_motor_dirs,
+    parse_command,
+    wheel_speeds,
+)
+from log import get_logger
+from telemetry import (
+    READ_TIMEOUT,
+    SAMPLE_INTERVAL,
+    TelemetryPublisher,
+    sample_reads,
+)
+
+# Constants
+MQTT_BROKER_ADDRESS = "localhost"
+MQTT_SUBSCRIPTIONS = ["robot/+/drive"]
+STATS_INTERVAL = 5
+
+log = get_logger("drive_mux")
+
+
+class RobotStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.applied = 0
+        self.coalesced = 0  # Commands replaced by a newer one before being sent
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_applied = 0
+        self.last_report = time.monotonic()
+
+    def record(self, latency):
+        with self.lock:
+            self.applied += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def report(self):
+        with self.lock:
+            now = time.monotonic()
+            rate = (self.applied - self.last_applied) / (now - self.last_report)
+            avg = self.latency_total / self.applied if self.applied else 0.0
+            report = {
+                "received": self.received,
+                "applied": self.applied,
+                "coalesced": self.coalesced,
+                "cmd_per_s": round(rate, 2),
+                "latency_avg_ms": round(avg * 1000, 2),
+                "latency_max_ms": round(self.latency_max * 1000, 2),
+            }
+            self.last_applied = self.applied
+            self.last_report = now
+            self.latency_max = 0.0
+            return report
+
+
+class Robot:
+    def __init__(
+        self,
+        name,
+        port,
+        topic,
+        motor_dir=MOTOR_DIR_PATH,
+        left_axis=0,
+        right_axis=1,
+    ):
+        self.name = name
+        self.port = port
+        self.topic = topic
+        self.motor_dir = motor_dir
+        self.left_axis = left_axis
+        self.right_axis = right_axis
+
+        self.stats = RobotStats()
+        self.motor_controller = None
+        # Single slot mailbox, only the newest setpoint matters
+        self.pending = None
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.telemetry = None
+
+    def start(self):
+        self.motor_controller = init_motor_controller(
+            port=self.port,
+            left_axis=self.left_axis,
+            right_axis=self.right_axis,
+            motor_dirs=load_motor_dirs(self.motor_dir),
+        )
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def submit(self, payload):
+        command = parse_command(payload)
+        with self.cond:
+            self.stats.received += 1
+            if command is None:
+                return
+            if self.pending is not None:
+                self.stats.coalesced += 1
+            self.pending = (command, time.monotonic())
+            self.cond.notify()
+
+    def run(self):
+        next_sample = time.monotonic()
+        reads = []
+        while True:
+            with self.cond:
+                if self.pending is None and self.running and not reads:
+                    self.cond.wait(max(0.0, next_sample - time.monotonic()))
+                if not self.running:
+                    return
+                command, self.pending = self.pending, None
+
+            if command is not None:
+                (linear, angular), received_at = command
+                try:
+                    self.set_velocity(linear, angular)
+                    self.stats.record(time.monotonic() - received_at)
+                except Exception as e:
+                    log.error("set_velocity_error", robot=self.name, error=e)
+                continue
+
+            # Telemetry shares this worker's link, one short read per pass so
+            # a setpoint that arrives mid-sample goes out before the next read
+            if self.telemetry is None:
+                next_sample = time.monotonic() + SAMPLE_INTERVAL
+                continue
+            if not reads:
+                if time.monotonic() < next_sample:
+                    continue
+                reads = sample_reads(self.motor_controller)
+            self.sample_telemetry(reads.pop(0))
+            if not reads:
+                next_sample = time.monotonic() + SAMPLE_INTERVAL
+
+    def sample_telemetry(self, read):
+        try:
+            with self.motor_controller.read_timeout(READ_TIMEOUT):
+                self.telemetry.offer(read())
+        except Exception as e:
+            log.warning("sample_error", robot=self.name, error=e)
+
+    def set_velocity(self, linear, angular):
+        left, right = wheel_speeds(linear, angular)
+        self.motor_controller.set_speed_mps_left(left)
+        self.motor_controller.set_speed_mps_right(right)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+        if self.motor_controller is not None:
+            self.set_velocity(0, 0)
+            self.motor_controller.clear_errors_left()
+            self.motor_controller.clear_errors_right()
+
+
+class DriveMux:
+    def __init__(self, robots, broker=MQTT_BROKER_ADDRESS, subscriptions=None):
+        for key in ("name", "topic", "port"):
+            values = [getattr(robot, key) for robot in robots]
+            duplicates = {v for v in values if values.count(v) > 1}
+            if duplicates:
+                raise ValueError(f"Duplicate robot {key}: {', '.join(duplicates)}")
+        self.robots = {robot.topic: robot for robot in robots}
+        self.broker = broker
+        self.subscriptions = list(subscriptions or MQTT_SUBSCRIPTIONS)
+        # Robots whose topic isn't covered by a wildcard get their own subscription
+        for topic in self.robots:
+            if not any(mqtt.topic_matches_sub(s, topic) for s in self.subscriptions):
+                self.subscriptions.append(topic)
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        for robot in robots:
+            robot.telemetry = TelemetryPublisher(
+                self.client, prefix=f"robot/{robot.name}/telemetry"
+            )
+
+    @classmethod
+    def from_config(cls, path):
+        with open(os.path.expanduser(path), "r") as f:
+            config = json.load(f)
+        robots = [Robot(**robot) for robot in config["robots"]]
+        return cls(
+            robots,
+            broker=config.get("broker", MQTT_BROKER_ADDRESS),
+            subscriptions=config.get("subscribe"),
+        )
+
+    def on_connect(self, client, userdata, flags, rc):
+        log.info("connected", rc=rc)
+        client.subscribe([(s, 0) for s in self.subscriptions])
+
+    def on_message(self, client, userdata, msg):
+        robot = self.robots.get(msg.topic)
+        if robot is None:
+            return
+        robot.submit(msg.payload.decode().strip().lower())
+
+    def start(self):
+        for robot in self.robots.values():
+            robot.start()
+        self.client.connect(self.broker)
+        self.client.loop_start()
+        for robot in self.robots.values():
+            robot.telemetry.start()
+
+    def stop(self):
+        for robot in self.robots.values():
+            robot.stop()
+            robot.telemetry.stop()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def report(self):
+        return {robot.name: robot.stats.report() for robot in self.robots.values()}
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "robots.json"
+    mux = DriveMux.from_config(path)
+
+    try:
+        mux.start()
+        log.info("listening", robots=len(mux.robots))
+
+        while True:
+            time.sleep(STATS_INTERVAL)
+            for name, stats in mux.report().items():
+                log.info("stats", robot=name, **stats)
+
+    except KeyboardInterrupt:
+        log.info("exiting")
+    except Exception as e:
+        log.error("error", error=e)
+
+    finally:
+        mux.stop()
+        log.info("shutdown_complete")
+
+
+if __name__ == "__main__":
+    main()
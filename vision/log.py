@@ -0,0 +1,167 @@
+# Low overhead structured logging for the hot paths.
+#
+# Records are tuples pushed onto a ring buffer and only formatted by a
+# background thread, so a slow console never stalls a setpoint. Disabled
+# levels are swapped for a no-op, and callers that build expensive fields
+# can check log.debug_enabled first.
+#
+#   LOG_LEVELS="info,drive=debug,odrive_uart=warning" python drive.py
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name.lower(): level for level, name in LEVEL_NAMES.items()}
+LEVELS["warn"] = WARNING
+
+# Values formatted as-is on the flush thread, anything else is stringified
+# at emit time so later mutation can't change what gets logged
+SCALARS = (str, int, float, bool, type(None))
+
+BUFFER_SIZE = 4096
+FLUSH_INTERVAL = 0.1
+
+
+def parse_levels(spec):
+    # Runs at import, so a typo in LOG_LEVELS is reported and skipped rather
+    # than taking the process down
+    default = INFO
+    levels = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, level = part.rpartition("=")
+        level = LEVELS.get(level.strip().lower())
+        if level is None:
+            sys.stderr.write(f"log ignoring unknown level in LOG_LEVELS: {part}\n")
+        elif name:
+            levels[name.strip()] = level
+        else:
+            default = level
+    return default, levels
+
+
+def _noop(msg, **fields):
+    pass
+
+
+class LogBuffer:
+    def __init__(self, stream=sys.stdout, size=BUFFER_SIZE, interval=FLUSH_INTERVAL):
+        self.stream = stream
+        self.records = deque(maxlen=size)
+        self.dropped = 0
+        self.interval = interval
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="log", daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append(record)
+        if len(self.records) > self.records.maxlen // 2:
+            self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            lines = []
+            while self.records:
+                lines.append(format_record(self.records.popleft()))
+            if self.dropped:
+                lines.append(f"log dropped={self.dropped}")
+                self.dropped = 0
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+
+
+def format_record(record):
+    t, level, name, msg, fields = record
+    text = f"{t:.6f} {LEVEL_NAMES[level]} {name} {msg}"
+    if fields:
+        text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+    return text
+
+
+class Logger:
+    def __init__(self, name, buffer, level=INFO, sample=None):
+        self.name = name
+        self.buffer = buffer
+        # Only log every nth record of the given messages, e.g. {"set_speeds": 10}
+        self.sample = dict(sample or {})
+        self.counts = dict.fromkeys(self.sample, 0)
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        self.debug_enabled = level <= DEBUG
+        self.info_enabled = level <= INFO
+        self.warning_enabled = level <= WARNING
+        self.debug = self._debug if self.debug_enabled else _noop
+        self.info = self._info if self.info_enabled else _noop
+        self.warning = self._warning if self.warning_enabled else _noop
+        self.error = self._error
+
+    def _emit(self, level, msg, fields):
+        rate = self.sample.get(msg)
+        if rate is not None:
+            count = self.counts[msg]
+            self.counts[msg] = count + 1
+            if count % rate:
+                return
+        for k, v in fields.items():
+            if not isinstance(v, SCALARS):
+                fields[k] = str(v)
+        self.buffer.append((time.time(), level, self.name, msg, fields))
+
+    def _debug(self, msg, **fields):
+        self._emit(DEBUG, msg, fields)
+
+    def _info(self, msg, **fields):
+        self._emit(INFO, msg, fields)
+
+    def _warning(self, msg, **fields):
+        self._emit(WARNING, msg, fields)
+
+    def _error(self, msg, **fields):
+        self._emit(ERROR, msg, fields)
+
+
+_buffer = None
+_loggers = {}
+_default_level, _levels = parse_levels(os.getenv("LOG_LEVELS", ""))
+
+
+def get_logger(name, sample=None):
+    global _buffer
+    if _buffer is None:
+        _buffer = LogBuffer()
+        atexit.register(_buffer.flush)
+    if name not in _loggers:
+        level = _levels.get(name, _default_level)
+        _loggers[name] = Logger(name, _buffer, level=level, sample=sample)
+    return _loggers[name]
+
+
+def set_level(name, level):
+    _levels[name] = level
+    if name in _loggers:
+        _loggers[name].set_level(level)
+
+
+def flush():
+    if _buffer is not None:
+        _buffer.flush()
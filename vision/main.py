@@ -1,5 +1,6 @@
-import json
+import sys
 import time
+from collections import deque
 
 import cv2
 import dotenv
@@ -7,6 +8,9 @@ from groq import Groq
 from openai import OpenAI
 
 from vision.camera import USBCamera
+from vision.log import get_logger
+from vision.plan import LoopMetrics, PlanExecutor, parse_actions
+from vision.s3 import upload_to_s3
 
 # from drive import set_velocity
 
@@ -19,6 +23,12 @@ def set_velocity(linear_velocity, angular_velocity):
 
 dotenv.load_dotenv()
 
+log = get_logger("main")
+
+# Earlier replies kept for context, e.g. to return to the original path.
+# Only the newest request carries an image.
+HISTORY_TURNS = 4
+
 client = Groq()
 
 system_message = {
@@ -43,12 +53,38 @@ Example:
 """,
 }
 
-messages = [
-    system_message,
-]
+plan_system_message = {
+    "role": "user",
+    "content": """
+You are a helpful assistant that returns a structured response to control a robot to head in a straight line and avoid obstacles. When going around obstacles return to your original path.
 
+The robot has two wheels and can move forward, back, and turn. Go slow. Less than 1 m/s and less than 1 rad/s. First think out loud about where you need to go and how far you need to go. Output a plan of up to 8 actions that covers everything you can see. The actions run back to back and you will be asked again when the plan finishes or something unexpected happens.
 
-def gpt(url):
+Output a JSON object with an "actions" list. Each action has the following fields:
+- linear_velocity: float (m/s)
+- angular_velocity: float (rad/s)
+- duration: int (centiseconds)
+Example:
+```json
+{
+    "actions": [
+        {"linear_velocity": 0.5, "angular_velocity": 0.0, "duration": 400},
+        {"linear_velocity": 0.0, "angular_velocity": 0.5, "duration": 150},
+        {"linear_velocity": 0.5, "angular_velocity": 0.0, "duration": 300}
+    ]
+}
+```
+""",
+}
+
+history = deque(maxlen=HISTORY_TURNS)
+
+
+def ask(url, system=system_message):
+    messages = [system]
+    for text in history:
+        messages.append({"role": "user", "content": "(earlier camera frame)"})
+        messages.append({"role": "assistant", "content": text})
     messages.append(
         {
             "role": "user",
@@ -63,51 +99,90 @@ def gpt(url):
         },
     )
 
-    print("Sending request to GPT")
+    log.info("sending_request")
     response = client.chat.completions.create(
         # model="o1-mini",
         model="llama-3.2-90b-vision-preview",
         messages=messages,
     )
-    messages.append(response.choices[0].message)
 
     text = response.choices[0].message.content
-    print(f"text: {text}")
-    json_text = text.split("```json")[1].split("```")[0]
+    history.append(text)
+    log.debug("response", text=text)
+    return text
 
-    action = json.loads(json_text)
-    linear_velocity = action["linear_velocity"]
-    angular_velocity = action["angular_velocity"]
-    duration = action["duration"]
 
-    print(f"Action: {action}")
-    if linear_velocity is None and angular_velocity is None:
-        raise ValueError("No action provided")
+def capture_frame(camera):
+    return camera.get_frame()
 
-    set_velocity(linear_velocity, angular_velocity)
-    time.sleep(duration / 100)
-    set_velocity(0, 0)
+
+def save_photo(frame, path="photo.png"):
+    frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    cv2.imwrite(path, frame)
 
 
 def take_photo():
+    # Holds the same device as vision/preview.py, don't run both at once
     camera = USBCamera(index=0)
 
-    print("Using USB Camera")
-    get_frame = camera.get_frame
-    frame = get_frame()
-    frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-
-    cv2.imwrite("photo.png", frame)
+    log.debug("using_usb_camera")
+    save_photo(capture_frame(camera))
 
 
 def upload_photo(path):
-    pass
+    return upload_to_s3(path)
 
 
-def main():
+def request_actions(metrics, system=system_message):
+    # The robot is stopped from here until the actions come back
+    start = time.monotonic()
     take_photo()
     url = upload_photo("photo.png")
-    gpt(url)
+    actions = parse_actions(ask(url, system))
+    metrics.add_call(time.monotonic() - start)
+    return actions
+
+
+def run_single(iterations):
+    metrics = LoopMetrics("single")
+    for _ in range(iterations):
+        action = request_actions(metrics)[0]
+        log.info("action", **action)
+
+        set_velocity(action["linear_velocity"], action["angular_velocity"])
+        time.sleep(action["duration"] / 100)
+        set_velocity(0, 0)
+        metrics.add_action(action, action["duration"] / 100)
+    return metrics
+
+
+def run_plan(iterations, get_odometry=None):
+    metrics = LoopMetrics("plan")
+    executor = PlanExecutor(set_velocity, metrics, get_odometry=get_odometry)
+    steps = 0
+    while steps < iterations:
+        if executor.needs_replan():
+            log.info("replanning", reason=executor.replan_reason)
+            executor.halt()
+            executor.begin_replan()
+            actions = request_actions(metrics, plan_system_message)
+            log.info("plan", actions=actions)
+            executor.load(actions)
+        executor.step()
+        steps += 1
+    executor.halt()
+    return metrics
+
+
+def main():
+    # python -m vision.main [--plan] [iterations]
+    args = sys.argv[1:]
+    plan = "--plan" in args
+    args = [a for a in args if a != "--plan"]
+    iterations = int(args[0]) if args else 1
+
+    metrics = run_plan(iterations) if plan else run_single(iterations)
+    log.info("metrics", **metrics.summary())
 
 
 if __name__ == "__main__":
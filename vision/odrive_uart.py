@@ -1,7 +1,11 @@
+import re
+import threading
 import time
+from contextlib import contextmanager
 
 import odrive.enums
 import serial
+from log import get_logger
 
 # This is l-gpio
 # from RPi import GPIO  # Import GPIO module
@@ -11,6 +15,13 @@ import serial
 # GPIO.setup(5, GPIO.OUT)
 
 
+log = get_logger("odrive_uart")
+
+# Float properties always come back with a decimal point, so a stale integer
+# reply (e.g. an axis error code) can't be mistaken for a voltage
+FLOAT_REPLY = re.compile(r"-?\d+\.\d+")
+
+
 class ODriveUART:
     AXIS_STATE_CLOSED_LOOP_CONTROL = 8
     ERROR_DICT = {
@@ -18,26 +29,33 @@ class ODriveUART:
     }
 
     SERIAL_PORT = "/dev/ttyAMA1"
-    _bus = serial.Serial(
-        port=SERIAL_PORT,
-        baudrate=115200,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        bytesize=serial.EIGHTBITS,
-        timeout=1,
-    )
 
     def __init__(
-        self, port="/dev/ttyAMA1", left_axis=0, right_axis=1, dir_left=1, dir_right=1
+        self,
+        port="/dev/ttyAMA1",
+        left_axis=0,
+        right_axis=1,
+        dir_left=1,
+        dir_right=1,
+        bus=None,
+        recorder=None,
     ):
-        self.bus = serial.Serial(
-            port=port,
-            baudrate=115200,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=1,
-        )
+        # bus lets a simulated port stand in for the serial link on replay
+        if bus is None:
+            bus = serial.Serial(
+                port=port,
+                baudrate=115200,
+                parity=serial.PARITY_NONE,
+                stopbits=serial.STOPBITS_ONE,
+                bytesize=serial.EIGHTBITS,
+                timeout=1,
+            )
+        self.bus = bus
+        self.recorder = recorder
+        # Keeps a write and its response together when several threads share the bus
+        self.lock = threading.Lock()
+        # Per-thread read timeout override, see read_timeout()
+        self.local = threading.local()
         self.left_axis = left_axis
         self.right_axis = right_axis
         self.dir_left = dir_left
@@ -47,17 +65,41 @@ class ODriveUART:
         self.bus.reset_input_buffer()
         self.bus.reset_output_buffer()
 
+    @contextmanager
+    def read_timeout(self, timeout):
+        # Shortens reads made from this thread, e.g. telemetry polling, so a
+        # missed response can't hold the bus lock for the full 1s timeout
+        self.local.timeout = timeout
+        try:
+            yield
+        finally:
+            self.local.timeout = None
+
     def send_command(self, command: str):
-        self.bus.reset_input_buffer()
-        self.bus.write(f"{command}\n".encode())
-        # Wait for the response if it's a read command
-        if command.startswith("r") or command.startswith("f"):
+        timeout = getattr(self.local, "timeout", None)
+        with self.lock:
+            self.bus.reset_input_buffer()
+            self.bus.write(f"{command}\n".encode())
+            if self.recorder is not None:
+                self.recorder.uart_tx(command)
+            # Wait for the response if it's a read command
+            if not (command.startswith("r") or command.startswith("f")):
+                return None
             # Read until a newline character is encountered
-            response = self.bus.readline().decode("ascii").strip()
-            # If the response is empty, print a debug message
-            if response == "":
-                print(f"No response received for command: {command}")
-            return response
+            if timeout is None:
+                response = self.bus.readline().decode("ascii").strip()
+            else:
+                default, self.bus.timeout = self.bus.timeout, timeout
+                try:
+                    response = self.bus.readline().decode("ascii").strip()
+                finally:
+                    self.bus.timeout = default
+            if self.recorder is not None:
+                self.recorder.uart_rx(response)
+        # If the response is empty, log a warning
+        if response == "":
+            log.warning("no_response", command=command)
+        return response
 
     def get_errors_left(self):
         return self.get_errors(self.left_axis)
@@ -72,7 +114,7 @@ class ODriveUART:
                 cleaned_response = "".join(c for c in error_response if c.isdigit())
                 error_code = int(cleaned_response)
             except ValueError:
-                print(f"Unexpected error response format: {error_response}")
+                log.warning("unexpected_response", response=error_response)
                 return True
             if error_code != 0:
                 return True
@@ -126,7 +168,7 @@ class ODriveUART:
     def enable_torque_mode(self, axis):
         self.send_command(f"w axis{axis}.controller.config.control_mode 1")
         self.send_command(f"w axis{axis}.controller.config.input_mode 1")
-        print(f"Axis {axis} set to torque control mode")
+        log.info("torque_mode", axis=axis)
 
     def enable_velocity_mode_left(self):
         self.enable_velocity_mode(self.left_axis)
@@ -137,7 +179,7 @@ class ODriveUART:
     def enable_velocity_mode(self, axis):
         self.send_command(f"w axis{axis}.controller.config.control_mode 2")
         self.send_command(f"w axis{axis}.controller.config.input_mode 1")
-        print(f"Axis {axis} set to velocity control mode")
+        log.info("velocity_mode", axis=axis)
 
     def start_left(self):
         self.start(self.left_axis)
@@ -215,7 +257,16 @@ class ODriveUART:
 
     def get_pos_vel(self, axis, direction):
         pos, vel = self.send_command(f"f {axis}").split(" ")
-        return float(pos) * direction, float(vel) * direction * 60
+        pos, vel = float(pos) * direction, float(vel) * direction * 60
+        if self.recorder is not None:
+            self.recorder.telemetry(axis, pos, vel)
+        return pos, vel
+
+    def get_bus_voltage(self):
+        response = self.send_command("r vbus_voltage")
+        if not FLOAT_REPLY.fullmatch(response):
+            raise ValueError(f"Unexpected vbus_voltage response: {response!r}")
+        return float(response)
 
     def stop_left(self):
         self.stop(self.left_axis)
@@ -242,7 +293,7 @@ class ODriveUART:
             cleaned_response = "".join(c for c in response if c.isdigit())
             return int(cleaned_response) != 0
         except ValueError:
-            print(f"Unexpected response format: {response}")
+            log.warning("unexpected_response", response=response)
             return True  # Assume there's an error if we can't parse the response
 
     def clear_errors_left(self):
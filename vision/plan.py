@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+def parse_actions(text):
+    # Accepts a single action, a list of actions or {"actions": [...]}
+    json_text = text.split("```json")[1].split("```")[0]
+    data = json.loads(json_text)
+    if isinstance(data, dict):
+        data = data.get("actions", [data])
+
+    if not isinstance(data, list):
+        raise ValueError("No action provided")
+
+    actions = []
+    for action in data:
+        if not isinstance(action, dict):
+            raise ValueError(f"Action is not an object: {action!r}")
+        linear_velocity = action.get("linear_velocity")
+        angular_velocity = action.get("angular_velocity")
+        if linear_velocity is None and angular_velocity is None:
+            raise ValueError("No action provided")
+        duration = action.get("duration", 0)
+        if (
+            isinstance(duration, bool)
+            or not isinstance(duration, (int, float))
+            or duration < 0
+        ):
+            raise ValueError(f"Invalid duration: {duration!r}")
+        actions.append(
+            {
+                "linear_velocity": linear_velocity or 0.0,
+                "angular_velocity": angular_velocity or 0.0,
+                "duration": duration,
+            }
+        )
+    if not actions:
+        raise ValueError("No action provided")
+    return actions
+
+
+class LoopMetrics:
+    """Model calls per meter and idle time for comparing plan vs single-action."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.model_calls = 0
+        self.distance = 0.0  # meters, from commanded velocity * duration
+        self.drive_time = 0.0
+        self.idle_time = 0.0  # robot stopped while waiting on capture/model
+        self.started = time.monotonic()
+
+    def add_call(self, idle):
+        self.model_calls += 1
+        self.idle_time += idle
+
+    def add_action(self, action, elapsed):
+        self.distance += abs(action["linear_velocity"]) * elapsed
+        self.drive_time += elapsed
+
+    def calls_per_meter(self):
+        if self.distance == 0:
+            return None
+        return self.model_calls / self.distance
+
+    def summary(self):
+        total = time.monotonic() - self.started
+        return {
+            "mode": self.mode,
+            "model_calls": self.model_calls,
+            "distance_m": round(self.distance, 3),
+            "calls_per_meter": self.calls_per_meter(),
+            "drive_time_s": round(self.drive_time, 3),
+            "idle_time_s": round(self.idle_time, 3),
+            "idle_fraction": round(self.idle_time / total, 3) if total else None,
+        }
+
+
+class PlanExecutor:
+    """
+    Consumes a queue of planned actions without stopping between them.
+    Replanning is requested when the queue runs dry, when replan_interval
+    has passed since the last plan, when odometry diverges from the
+    commanded distance or when an obstacle is reported.
+
+    get_odometry returns the path length in meters the robot has travelled
+    since some fixed start (e.g. WheelOdometry.path_length), and is compared
+    against |linear_velocity| * time of the executed actions. Obstacles are
+    reported by calling report_obstacle() from any thread.
+    """
+
+    def __init__(
+        self,
+        set_velocity,
+        metrics,
+        replan_interval=10.0,
+        max_divergence=0.3,
+        get_odometry=None,
+    ):
+        self.set_velocity = set_velocity
+        self.metrics = metrics
+        self.replan_interval = replan_interval
+        self.max_divergence = max_divergence
+        # Callable returning path length in meters, None to disable
+        self.get_odometry = get_odometry
+
+        self.queue = deque()
+        self.obstacle = threading.Event()
+        self.planned_at = 0.0
+        self.expected_distance = 0.0
+        self.odometry_start = 0.0
+        self.replan_reason = "start"
+
+    def load(self, actions):
+        self.queue.clear()
+        self.queue.extend(actions)
+        self.planned_at = time.monotonic()
+        self.expected_distance = 0.0
+        self.odometry_start = self.get_odometry() if self.get_odometry else 0.0
+        self.replan_reason = None
+
+    def begin_replan(self):
+        # Clear before capturing, so an obstacle reported while the model is
+        # thinking still triggers another replan once the new plan is loaded
+        self.obstacle.clear()
+
+    def report_obstacle(self):
+        self.obstacle.set()
+
+    def divergence(self):
+        if self.get_odometry is None:
+            return 0.0
+        travelled = abs(self.get_odometry() - self.odometry_start)
+        return abs(travelled - self.expected_distance)
+
+    def needs_replan(self):
+        if self.replan_reason is not None:
+            return True
+        if not self.queue:
+            self.replan_reason = "empty"
+        elif self.obstacle.is_set():
+            self.replan_reason = "obstacle"
+        elif time.monotonic() - self.planned_at > self.replan_interval:
+            self.replan_reason = "schedule"
+        elif self.divergence() > self.max_divergence:
+            self.replan_reason = "odometry"
+        return self.replan_reason is not None
+
+    def step(self):
+        action = self.queue.popleft()
+        self.set_velocity(action["linear_velocity"], action["angular_velocity"])
+
+        # Sleep in short slices so an obstacle can cut the action short
+        start = time.monotonic()
+        end = start + action["duration"] / 100
+        while time.monotonic() < end and not self.obstacle.is_set():
+            time.sleep(max(0.0, min(0.05, end - time.monotonic())))
+        elapsed = time.monotonic() - start
+
+        self.metrics.add_action(action, elapsed)
+        self.expected_distance += abs(action["linear_velocity"]) * elapsed
+
+    def halt(self):
+        self.set_velocity(0, 0)
+
+
+class WheelOdometry:
+    """Path length of the robot's center from ODrive wheel positions."""
+
+    def __init__(self, motor_controller, wheel_diameter=0.165):
+        self.motor_controller = motor_controller
+        self.meters_per_turn = wheel_diameter * 3.14159
+        self.distance = 0.0
+        self.last = None
+
+    def path_length(self):
+        left = self.motor_controller.get_position_turns_left()
+        right = self.motor_controller.get_position_turns_right()
+        if self.last is not None:
+            d_left = left - self.last[0]
+            d_right = right - self.last[1]
+            self.distance += abs(d_left + d_right) / 2 * self.meters_per_turn
+        self.last = (left, right)
+        return self.distance
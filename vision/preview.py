@@ -0,0 +1,305 @@
+# Low latency camera preview for the controller web app.
+#
+# Frames are rotated, downscaled and JPEG encoded once, then fanned out to
+# an MQTT topic (read by the controller over websockets) and an MJPEG
+# endpoint at http://<robot>:8080/stream.mjpg. Sinks always take the newest
+# frame, so a slow client skips frames instead of queueing them, and
+# frame rate/quality back off while any sink is behind.
+#
+# This opens USBCamera(index=0) itself, so it can't run alongside the vision
+# loop (vision/main.py take_photo), which opens the same device.
+#
+#   python -m vision.preview
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import paho.mqtt.client as mqtt
+
+from vision.camera import USBCamera
+from vision.log import get_logger
+
+MQTT_BROKER_ADDRESS = "localhost"
+MQTT_TOPIC = "robot/camera/preview"
+HTTP_PORT = 8080
+PREVIEW_WIDTH = 320
+MAX_FPS = 15
+MIN_FPS = 2
+MAX_QUALITY = 80
+MIN_QUALITY = 30
+MAX_BACKLOG = 2  # Unsent MQTT frames before we drop and back off
+STATS_INTERVAL = 5
+
+log = get_logger("preview")
+
+
+class LatencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.sent = 0
+        self.dropped = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def record(self, latency):
+        with self.lock:
+            self.sent += 1
+            self.total += latency
+            self.worst = max(self.worst, latency)
+
+    def drop(self, count=1):
+        with self.lock:
+            self.dropped += count
+
+    def report(self):
+        with self.lock:
+            report = {
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "latency_avg_ms": round(self.total / self.sent * 1000, 1)
+                if self.sent
+                else 0.0,
+                "latency_max_ms": round(self.worst * 1000, 1),
+            }
+            self.reset()
+            return report
+
+
+class Adapter:
+    """Backs off fps/quality while a sink is behind and recovers slowly."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fps = MAX_FPS
+        self.quality = MAX_QUALITY
+        self.clear_frames = 0
+
+    def report(self, behind):
+        with self.lock:
+            if behind:
+                self.clear_frames = 0
+                self.fps = max(MIN_FPS, self.fps * 0.8)
+                self.quality = max(MIN_QUALITY, self.quality - 10)
+            else:
+                self.clear_frames += 1
+                if self.clear_frames >= self.fps:
+                    self.clear_frames = 0
+                    self.fps = min(MAX_FPS, self.fps + 1)
+                    self.quality = min(MAX_QUALITY, self.quality + 5)
+
+
+class FrameSource:
+    def __init__(self, camera, adapter):
+        self.camera = camera
+        self.adapter = adapter
+        self.cond = threading.Condition()
+        # (seq, captured_at, jpeg bytes)
+        self.frame = (0, 0.0, None)
+        self.running = True
+
+    def run(self):
+        seq = 0
+        while self.running:
+            start = time.monotonic()
+            frame = self.camera.get_frame()
+            if frame is None:
+                time.sleep(0.1)
+                continue
+            captured_at = time.monotonic()
+
+            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+            height, width = frame.shape[:2]
+            if width > PREVIEW_WIDTH:
+                size = (PREVIEW_WIDTH, height * PREVIEW_WIDTH // width)
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            ok, jpeg = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.adapter.quality)]
+            )
+            if not ok:
+                continue
+
+            seq += 1
+            with self.cond:
+                self.frame = (seq, captured_at, jpeg.tobytes())
+                self.cond.notify_all()
+
+            time.sleep(max(0.0, 1 / self.adapter.fps - (time.monotonic() - start)))
+
+    def wait(self, last_seq, timeout=1.0):
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.frame[0] != last_seq or not self.running, timeout
+            )
+            return self.frame
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+
+class MqttSink:
+    def __init__(self, source, adapter, broker=MQTT_BROKER_ADDRESS, topic=MQTT_TOPIC):
+        self.source = source
+        self.adapter = adapter
+        self.topic = topic
+        self.stats = LatencyStats()
+        self.inflight = []
+        # mid -> captured_at, latency is recorded once paho has sent the frame
+        self.sending = {}
+        self.sent_early = {}
+        self.lock = threading.Lock()
+        self.client = mqtt.Client()
+        self.client.on_publish = self.on_publish
+        self.client.on_disconnect = self.on_disconnect
+        # Async so a broker that's down doesn't take the MJPEG endpoint with it,
+        # loop_start keeps retrying in the background
+        self.client.connect_async(broker)
+        self.client.loop_start()
+
+    def run(self):
+        seq = 0
+        while self.source.running:
+            new_seq, captured_at, jpeg = self.source.wait(seq)
+            if new_seq == seq or jpeg is None:
+                continue
+            if seq:
+                self.stats.drop(new_seq - seq - 1)
+            seq = new_seq
+
+            with self.lock:
+                self.inflight = [m for m in self.inflight if not m.is_published()]
+                backlog = len(self.inflight)
+            if backlog >= MAX_BACKLOG:
+                self.stats.drop()
+                self.adapter.report(behind=True)
+                continue
+            self.adapter.report(behind=bool(backlog))
+
+            # Not under self.lock, paho may hold its own locks while calling on_publish
+            info = self.client.publish(self.topic, jpeg, qos=0)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                # Not connected, this frame will never be sent
+                self.stats.drop()
+                continue
+            with self.lock:
+                self.inflight.append(info)
+                # on_publish can beat us here if the network thread is quick
+                sent_at = self.sent_early.pop(info.mid, None)
+                if sent_at is None:
+                    self.sending[info.mid] = captured_at
+                else:
+                    self.stats.record(sent_at - captured_at)
+
+    def on_publish(self, client, userdata, mid):
+        now = time.monotonic()
+        with self.lock:
+            captured_at = self.sending.pop(mid, None)
+            if captured_at is None:
+                self.sent_early[mid] = now
+                return
+        self.stats.record(now - captured_at)
+
+    def on_disconnect(self, client, userdata, rc):
+        # QoS 0 frames queued before a disconnect are never completed
+        with self.lock:
+            self.inflight = []
+            self.sending.clear()
+            self.sent_early.clear()
+        log.warning("mqtt_disconnected", rc=rc)
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def make_handler(source, adapter, stats):
+    class MjpegHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/stream.mjpg":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header(
+                "Content-Type", "multipart/x-mixed-replace; boundary=frame"
+            )
+            self.end_headers()
+
+            seq = 0
+            try:
+                while source.running:
+                    new_seq, captured_at, jpeg = source.wait(seq)
+                    if new_seq == seq or jpeg is None:
+                        continue
+                    if seq:
+                        stats.drop(new_seq - seq - 1)
+                    seq = new_seq
+
+                    start = time.monotonic()
+                    self.wfile.write(
+                        b"--frame\r\nContent-Type: image/jpeg\r\n"
+                        + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+                        + jpeg
+                        + b"\r\n"
+                    )
+                    self.wfile.flush()
+                    stats.record(time.monotonic() - captured_at)
+                    # A write slower than a frame interval means the client is behind
+                    adapter.report(behind=time.monotonic() - start > 1 / adapter.fps)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            log.debug("http", client=self.client_address[0], request=format % args)
+
+    return MjpegHandler
+
+
+def main():
+    camera = USBCamera(index=0)
+    adapter = Adapter()
+    source = FrameSource(camera, adapter)
+    mqtt_sink = MqttSink(source, adapter)
+    http_stats = LatencyStats()
+    server = ThreadingHTTPServer(
+        ("", HTTP_PORT), make_handler(source, adapter, http_stats)
+    )
+    server.daemon_threads = True
+
+    threads = [
+        threading.Thread(target=source.run, name="capture", daemon=True),
+        threading.Thread(target=mqtt_sink.run, name="mqtt", daemon=True),
+        threading.Thread(target=server.serve_forever, name="http", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    log.info("streaming", topic=MQTT_TOPIC, port=HTTP_PORT)
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            log.info(
+                "stats",
+                fps=round(adapter.fps, 1),
+                quality=adapter.quality,
+                **{f"mqtt_{k}": v for k, v in mqtt_sink.stats.report().items()},
+                **{f"http_{k}": v for k, v in http_stats.report().items()},
+            )
+    except KeyboardInterrupt:
+        log.info("exiting")
+    finally:
+        source.stop()
+        server.shutdown()
+        mqtt_sink.stop()
+        camera.release()
+
+
+if __name__ == "__main__":
+    main()
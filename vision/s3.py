@@ -5,8 +5,12 @@ from dotenv import load_dotenv
 import os
 from datetime import datetime
 
+from vision.log import get_logger
+
 load_dotenv()
 
+log = get_logger("s3")
+
 def take_picture():
     pass
 
@@ -27,7 +31,7 @@ def upload_to_s3(image_path):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         s3_key = f"robot_images/{timestamp}.png"
         
-        print(f"Uploading {image_path} to S3...")
+        log.debug("uploading", path=image_path, key=s3_key)
         s3_client.upload_file(
             Filename=image_path,    # Local file
             Bucket=bucket_name,     # S3 bucket name
@@ -47,7 +51,7 @@ def upload_to_s3(image_path):
         return url
         
     except Exception as e:
-        print(f"Error uploading to S3: {e}")
+        log.error("upload_error", path=image_path, error=e)
         return None
 
 
@@ -0,0 +1,183 @@
+# Publishes ODrive telemetry to MQTT.
+#
+# Samples are coalesced into the latest value per channel and flushed at
+# PUBLISH_RATE as one compact JSON message per topic, containing only the
+# channels that moved past their threshold since they were last sent.
+# Everything is resent every HEARTBEAT seconds so late subscribers catch up.
+#
+#   robot/telemetry/wheels  {"t":...,"left_pos":1.23,"left_vel":30.5}
+#   robot/telemetry/errors  {"t":...,"left_error":false}
+#   robot/telemetry/bus     {"t":...,"vbus":24.1}
+
+import json
+import threading
+import time
+
+from log import get_logger
+
+TOPIC_PREFIX = "robot/telemetry"
+SAMPLE_INTERVAL = 0.1
+READ_TIMEOUT = 0.02  # A response is a few ms at 115200 baud
+PUBLISH_RATE = 5
+HEARTBEAT = 5.0
+
+# channel: (topic, change threshold)
+CHANNELS = {
+    "left_pos": ("wheels", 0.01),  # turns
+    "left_vel": ("wheels", 1.0),  # rpm
+    "right_pos": ("wheels", 0.01),
+    "right_vel": ("wheels", 1.0),
+    "left_error": ("errors", 0),
+    "right_error": ("errors", 0),
+    "vbus": ("bus", 0.1),  # volts
+}
+QOS = {"wheels": 0, "bus": 0, "errors": 1}
+
+log = get_logger("telemetry")
+
+
+class TelemetryPublisher:
+    def __init__(
+        self,
+        client,
+        prefix=TOPIC_PREFIX,
+        rate=PUBLISH_RATE,
+        channels=CHANNELS,
+        qos=QOS,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.interval = 1 / rate
+        self.channels = channels
+        self.qos = qos
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.sent = {}
+        self.last_heartbeat = 0.0
+        self.running = False
+        self.thread = None
+
+    def offer(self, samples):
+        # Called from the sampling side, only ever swaps a dict under a lock
+        with self.lock:
+            self.pending.update(samples)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            self.flush()
+
+    def changed(self, name, value):
+        if name not in self.sent:
+            return True
+        last = self.sent[name]
+        threshold = self.channels[name][1]
+        if isinstance(value, bool) or not threshold:
+            return value != last
+        return abs(value - last) > threshold
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        now = time.time()
+        heartbeat = now - self.last_heartbeat > HEARTBEAT
+        if heartbeat:
+            self.last_heartbeat = now
+
+        batches = {}
+        for name, value in pending.items():
+            if name not in self.channels:
+                continue
+            if heartbeat or self.changed(name, value):
+                topic = self.channels[name][0]
+                if isinstance(value, float):
+                    value = round(value, 4)
+                batches.setdefault(topic, {})[name] = value
+                self.sent[name] = value
+
+        for topic, values in batches.items():
+            values["t"] = round(now, 3)
+            self.client.publish(
+                f"{self.prefix}/{topic}",
+                json.dumps(values, separators=(",", ":")),
+                qos=self.qos.get(topic, 0),
+            )
+
+
+def error_flag(motor_controller, axis):
+    # check_errors() reports a missed response as an error, which a short
+    # telemetry timeout would turn into false alarms, so skip those instead.
+    # Anything but a bare integer is a late reply to another read, e.g. "24.0"
+    # from vbus_voltage, and is skipped too
+    response = motor_controller.send_command(f"r axis{axis}.error")
+    if not response:
+        raise TimeoutError(f"No response for axis{axis}.error")
+    if not response.isdigit():
+        raise ValueError(f"Unexpected axis{axis}.error response: {response!r}")
+    return int(response) != 0
+
+
+def sample_reads(motor_controller):
+    """
+    One UART round trip per read, each returning a dict of channels, so a
+    caller can send a waiting setpoint between them.
+    """
+    mc = motor_controller
+    return [
+        lambda: dict(zip(("left_pos", "left_vel"), mc.get_pos_vel_left())),
+        lambda: dict(zip(("right_pos", "right_vel"), mc.get_pos_vel_right())),
+        lambda: {"left_error": error_flag(mc, mc.left_axis)},
+        lambda: {"right_error": error_flag(mc, mc.right_axis)},
+        lambda: {"vbus": mc.get_bus_voltage()},
+    ]
+
+
+class TelemetrySampler:
+    """
+    Polls the ODrive from its own thread. Each UART transaction holds the
+    controller lock only for itself and uses READ_TIMEOUT, so a setpoint
+    waits for at most one short read.
+    """
+
+    def __init__(self, motor_controller, publisher, interval=SAMPLE_INTERVAL):
+        self.motor_controller = motor_controller
+        self.publisher = publisher
+        self.interval = interval
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        reads = sample_reads(self.motor_controller)
+        with self.motor_controller.read_timeout(READ_TIMEOUT):
+            while self.running:
+                start = time.monotonic()
+                for read in reads:
+                    try:
+                        self.publisher.offer(read())
+                    except Exception as e:
+                        log.warning("sample_error", error=e)
+                time.sleep(max(0.0, self.interval - (time.monotonic() - start)))